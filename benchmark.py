@@ -0,0 +1,309 @@
+"""
+Pairing benchmark.
+
+Generates synthetic tournaments (realistic Elo spread, Elo-based random results)
+and drives them through every round, either straight through the pairing engine
+or through swiss_pairings_participants on an in-memory SQLite database.
+
+For each round it records wall time, peak memory, the number of legality checks
+(pairs the engine tested for rematches and colour rules), get_color_preference
+calls, floaters, absolute color violations and the total score difference
+of the pairings, and writes everything as JSON so runs of different versions can
+be compared:
+
+    python benchmark.py --sizes 16 64 256 1024 --output before.json
+    python benchmark.py --sizes 16 64 256 1024 --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import pairing
+from pairing import (PairingProfile, PlayerState, apply_delta, clear_feasibility_cache,
+                     get_color_preference, pair_round)
+
+DEFAULT_SIZES = [16, 64, 256, 1024]
+MAX_SIZE = 50000
+# Above this a matching round takes seconds (about 1s at 8192 players, 3-4s at 16384)
+# and db mode is slower still, so a full run of many rounds takes a while.
+LARGE_SIZE = 8192
+
+
+class CallCounter:
+    """Counts calls to the engine functions we care about by wrapping them in place."""
+
+    def __init__(self):
+        self.counts = {'get_color_preference': 0}
+        self._patched = []
+
+    def install(self):
+        # Legality checks are batched per bracket (often in NumPy), so they are
+        # counted through the pairing profile instead, see legality_checks()
+        self._wrap(pairing, 'get_color_preference', 'get_color_preference')
+
+    def uninstall(self):
+        for owner, attr, original in self._patched:
+            setattr(owner, attr, original)
+        self._patched = []
+
+    def reset(self):
+        for key in self.counts:
+            self.counts[key] = 0
+
+    def _wrap(self, owner, attr, key):
+        original = getattr(owner, attr)
+        counts = self.counts
+
+        def counted(*args, **kwargs):
+            counts[key] += 1
+            return original(*args, **kwargs)
+
+        self._patched.append((owner, attr, original))
+        setattr(owner, attr, counted)
+
+
+def legality_checks(profile):
+    """Candidate pairs whose legality the engine tested this round."""
+    return profile.counters.get('candidate_pairs', 0)
+
+
+def synthetic_players(size, rng):
+    """Players with a normal Elo spread around 1600, clipped to a realistic range."""
+    players = []
+    for i in range(size):
+        elo = int(min(2800, max(800, rng.gauss(1600, 300))))
+        players.append(PlayerState(i + 1, name=f"Player {i + 1}", elo=elo))
+    return players
+
+
+def play_game(white_elo, black_elo, rng):
+    """Random result from the Elo expectation, with a fixed share of draws."""
+    expected = 1.0 / (1.0 + 10 ** ((black_elo - white_elo) / 400.0))
+    draw_chance = 0.3
+    roll = rng.random()
+    if roll < draw_chance:
+        return 'draw'
+    return 'white' if rng.random() < expected else 'black'
+
+
+def pairing_metrics(states_by_id, pairings, bye_id, round_number):
+    """Quality figures for one round, measured against the states before pairing."""
+    absolute_violations = 0
+    score_difference = 0.0
+    floaters = 0
+    for match in pairings:
+        white = states_by_id[match['white_id']]
+        black = states_by_id[match['black_id']]
+        white_pref = get_color_preference(white, round_number)
+        black_pref = get_color_preference(black, round_number)
+        if white_pref.type == 'absolute' and white_pref.color == 'black':
+            absolute_violations += 1
+        if black_pref.type == 'absolute' and black_pref.color == 'white':
+            absolute_violations += 1
+        diff = abs(white.score - black.score)
+        score_difference += diff
+        if diff:
+            floaters += 2
+
+    paired = 2 * len(pairings) + (1 if bye_id is not None else 0)
+    return {
+        'boards': len(pairings),
+        'floaters': floaters,
+        'unpaired': len(states_by_id) - paired,
+        'absolute_color_violations': absolute_violations,
+        'total_score_difference': score_difference,
+    }
+
+
+def measure_peak_memory(func, *args, **kwargs):
+    """Peak traced allocation while running func; tracing is only on for this call."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_engine(size, rounds, method, seed, counter, track_memory=True):
+    rng = random.Random(seed)
+    states = synthetic_players(size, rng)
+    states_by_id = {s.id: s for s in states}
+    records = []
+
+    for round_number in range(1, rounds + 1):
+        counter.reset()
+        profile = PairingProfile()
+        start = time.perf_counter()
+        result = pair_round(states, round_number, pairing_method=method, profile=profile)
+        elapsed = time.perf_counter() - start
+        calls = dict(counter.counts)
+        # pair_round does not modify its input, so a second, traced run gives the
+        # memory figure without tracemalloc's overhead skewing the timing. It would
+        # find the first run's feasibility matching cached, so start it cold.
+        peak = None
+        if track_memory:
+            clear_feasibility_cache()
+            peak = measure_peak_memory(pair_round, states, round_number, pairing_method=method)
+
+        record = {'round': round_number, 'wall_time_s': elapsed, 'peak_memory_bytes': peak}
+        record.update(pairing_metrics(states_by_id, result.pairings, result.bye_id, round_number))
+        record['legality_checks'] = legality_checks(profile)
+        record.update({f'{name}_calls': count for name, count in calls.items()})
+        records.append(record)
+
+        for player_id, delta in result.deltas.items():
+            apply_delta(states_by_id[player_id], delta)
+        for match in result.pairings:
+            white = states_by_id[match['white_id']]
+            black = states_by_id[match['black_id']]
+            outcome = play_game(white.elo, black.elo, rng)
+            if outcome == 'white':
+                white.score += 1.0
+            elif outcome == 'black':
+                black.score += 1.0
+            else:
+                white.score += 0.5
+                black.score += 0.5
+
+    return records
+
+
+def run_database(size, rounds, method, seed, counter, track_memory=True):
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    import app as swiss
+
+    rng = random.Random(seed)
+    records = []
+    with swiss.app.app_context():
+        tournament = swiss.Tournament(name=f"bench-{size}-{seed}-{time.time_ns()}", rounds=rounds, max_players=size)
+        swiss.db.session.add(tournament)
+        swiss.db.session.commit()
+        for player in synthetic_players(size, rng):
+            swiss.db.session.add(swiss.Participant(name=player.name, elo=player.elo, tournament_id=tournament.id))
+        swiss.db.session.commit()
+
+        for round_number in range(1, rounds + 1):
+            participants = swiss.Participant.query.filter_by(tournament_id=tournament.id).all()
+            before = {p.id: swiss.player_state_from_participant(p) for p in participants}
+
+            counter.reset()
+            profile = PairingProfile()
+            if track_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            pairings, bye_player = swiss.swiss_pairings_participants(participants, round_number,
+                                                                       pairing_method=method, profile=profile)
+            swiss.save_round_pairings(tournament.id, round_number, pairings, [bye_player] if bye_player else [])
+            elapsed = time.perf_counter() - start
+            peak = None
+            if track_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            calls = dict(counter.counts)
+
+            record = {'round': round_number, 'wall_time_s': elapsed, 'peak_memory_bytes': peak}
+            record.update(pairing_metrics(before, pairings, bye_player.id if bye_player else None, round_number))
+            record['legality_checks'] = legality_checks(profile)
+            record.update({f'{name}_calls': count for name, count in calls.items()})
+            records.append(record)
+
+            form = {}
+            for match in pairings:
+                white = before[match['white_id']]
+                black = before[match['black_id']]
+                form[f"winner_{match['white_id']}-{match['black_id']}"] = play_game(white.elo, black.elo, rng)
+            swiss.save_round_results(tournament.id, round_number, form)
+
+    return records
+
+
+def summarize(runs):
+    lines = []
+    for run in runs:
+        total = sum(r['wall_time_s'] for r in run['rounds'])
+        peak = max(r['peak_memory_bytes'] or 0 for r in run['rounds'])
+        violations = sum(r['absolute_color_violations'] for r in run['rounds'])
+        unpaired = sum(r['unpaired'] for r in run['rounds'])
+        lines.append(f"{run['mode']:>8} {run['method']:>8} {run['size']:>6} players  "
+                     f"{total:9.3f}s  peak {peak / 1e6:8.1f} MB  "
+                     f"unpaired {unpaired:4d}  abs-color violations {violations:4d}")
+    return "\n".join(lines)
+
+
+def compare(runs, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r['mode'], r['method'], r['size']): r for r in baseline['runs']}
+    lines = []
+    for run in runs:
+        old = previous.get((run['mode'], run['method'], run['size']))
+        if not old:
+            continue
+        new_time = sum(r['wall_time_s'] for r in run['rounds'])
+        old_time = sum(r['wall_time_s'] for r in old['rounds'])
+        new_diff = sum(r['total_score_difference'] for r in run['rounds'])
+        old_diff = sum(r['total_score_difference'] for r in old['rounds'])
+        ratio = new_time / old_time if old_time else float('inf')
+        lines.append(f"{run['mode']:>8} {run['method']:>8} {run['size']:>6} players  "
+                     f"time x{ratio:6.2f}  score difference {old_diff:g} -> {new_diff:g}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Swiss pairing speed and quality.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help=f"tournament sizes to generate (2 .. {MAX_SIZE})")
+    parser.add_argument('--rounds', type=int, default=9)
+    parser.add_argument('--method', choices=['matching', 'greedy', 'anytime'], default='matching')
+    parser.add_argument('--mode', choices=['engine', 'db'], default='engine',
+                        help="engine: pair PlayerStates directly; db: go through swiss_pairings_participants on in-memory SQLite")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip tracemalloc (in db mode tracing slows the timed run down)")
+    parser.add_argument('--output', help="write JSON results to this file (default: stdout)")
+    parser.add_argument('--compare', help="previous JSON output to compare against")
+    args = parser.parse_args(argv)
+    if any(size < 2 or size > MAX_SIZE for size in args.sizes):
+        parser.error(f"--sizes must be between 2 and {MAX_SIZE}")
+    if max(args.sizes) > LARGE_SIZE:
+        print(f"warning: sizes above {LARGE_SIZE} take seconds per round", file=sys.stderr)
+
+    counter = CallCounter()
+    counter.install()
+    runs = []
+    try:
+        for size in args.sizes:
+            runner = run_engine if args.mode == 'engine' else run_database
+            records = runner(size, args.rounds, args.method, args.seed, counter,
+                             track_memory=not args.no_memory)
+            runs.append({'mode': args.mode, 'method': args.method, 'size': size,
+                         'seed': args.seed, 'rounds': records})
+            print(summarize(runs[-1:]), file=sys.stderr)
+    finally:
+        counter.uninstall()
+
+    output = {
+        'python': platform.python_version(),
+        'numpy': pairing.np is not None,
+        'runs': runs,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        print(compare(runs, args.compare), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1228 @@
+"""
+Swiss pairing engine.
+
+Works on plain PlayerState records and returns the round's pairings plus a
+StateDelta per affected player, without touching the database or JSON.
+app.py loads the states from Participant rows and applies the deltas; the
+engine itself can run in worker processes or benchmarks without an app context.
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager, nullcontext
+
+try:
+    import numpy as np
+except ImportError:  # bracket cost matrices fall back to per-pair scoring
+    np = None
+
+from matching import max_cardinality_matching, max_weight_matching
+
+# Score brackets up to this size are solved on the complete compatibility graph.
+# Bigger brackets only keep each player's best MATCHING_NEIGHBOURS candidates,
+# which keeps the blossom matching fast on large opens.
+MATCHING_FULL_GRAPH_LIMIT = 64
+MATCHING_NEIGHBOURS = 16
+# Brackets above MATCHING_WINDOW players are matched in windows of about that size
+# (see pair_bracket_by_matching); the blossom matching is cubic, windows keep it linear.
+MATCHING_WINDOW = 32
+
+# "anytime" pairing: wall-clock budget per round (seconds), how many pairings (or
+# unpaired players) each search block holds at first, and the largest block in players
+ANYTIME_TIME_BUDGET = 0.2
+ANYTIME_INITIAL_WINDOW = 4
+ANYTIME_MAX_WINDOW = 64
+
+# Integer codes used by the vectorized bracket cost matrix
+COLOR_CODES = {'white': 1, 'black': 2}
+PREFERENCE_CODES = {'mild': 1, 'strong': 2, 'absolute': 3}
+
+
+class PlayerState:
+    """Pairing-time view of one participant: scores, colors, floats and opponents as plain lists."""
+    __slots__ = ('id', 'name', 'elo', 'score', 'white_count', 'black_count',
+                 'last_colors', 'float_history', 'opponents', 'bye_count')
+
+    def __init__(self, id, name=None, elo=1000, score=0.0, white_count=0, black_count=0,
+                 last_colors=None, float_history=None, opponents=None, bye_count=0):
+        self.id = id
+        self.name = name
+        self.elo = elo
+        self.score = score
+        self.white_count = white_count
+        self.black_count = black_count
+        self.last_colors = last_colors if last_colors is not None else []
+        self.float_history = float_history if float_history is not None else []
+        self.opponents = opponents if opponents is not None else []
+        self.bye_count = bye_count
+
+    @property
+    def color_diff(self):
+        return self.white_count - self.black_count
+
+class StateDelta:
+    """
+    What one round changes for one player:
+    opponent_id/color for a game, float_dir (appended when record_float is set),
+    bye for a bye round and score_delta for points awarded at pairing time.
+    """
+    __slots__ = ('opponent_id', 'color', 'float_dir', 'record_float', 'bye', 'score_delta')
+
+    def __init__(self, opponent_id=None, color=None, float_dir=None, record_float=False,
+                 bye=False, score_delta=0.0):
+        self.opponent_id = opponent_id
+        self.color = color
+        self.float_dir = float_dir
+        self.record_float = record_float
+        self.bye = bye
+        self.score_delta = score_delta
+
+class PairingResult:
+    """
+    pairings: list of pairing dicts, bye_id: player id or None, deltas: player id -> StateDelta,
+    profile: the PairingProfile passed to pair_round (None when profiling was off)
+    """
+    __slots__ = ('pairings', 'bye_id', 'deltas', 'profile')
+
+    def __init__(self, pairings, bye_id, deltas, profile=None):
+        self.pairings = pairings
+        self.bye_id = bye_id
+        self.deltas = deltas
+        self.profile = profile
+
+class PairingProfile:
+    """
+    Optional instrumentation for one round: accumulated seconds per phase, counters
+    (candidate pairs evaluated, legality rejections, ...) and per-bracket floater figures.
+    Plain dicts and lists only, so it survives pickling to and from worker processes.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self.brackets = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def bracket(self, score, players, floaters):
+        self.brackets.append({'score': score, 'players': players, 'floaters': floaters})
+
+    def as_dict(self):
+        return {'phases': self.phases, 'counters': self.counters, 'brackets': self.brackets}
+
+class _NullProfile:
+    """Stand-in used when profiling is off: every hook is a no-op."""
+    enabled = False
+    _phase = nullcontext()
+
+    def phase(self, name):
+        return self._phase
+
+    def count(self, name, amount=1):
+        pass
+
+    def bracket(self, score, players, floaters):
+        pass
+
+NULL_PROFILE = _NullProfile()
+
+def apply_delta(state, delta):
+    """Advance a PlayerState by one round."""
+    if delta.opponent_id is not None:
+        state.opponents.append(delta.opponent_id)
+    if delta.color == 'white':
+        state.white_count += 1
+        state.last_colors.append('white')
+    elif delta.color == 'black':
+        state.black_count += 1
+        state.last_colors.append('black')
+    if delta.record_float:
+        state.float_history.append(delta.float_dir)
+    if delta.bye:
+        state.bye_count += 1
+    state.score += delta.score_delta
+
+class ColorPreference:
+    """A player's color preference for one round (see get_color_preference)."""
+    __slots__ = ('type', 'color', 'games_played', 'mild_adjustable')
+
+    def __init__(self, pref_type=None, color=None, games_played=0, mild_adjustable=False):
+        self.type = pref_type
+        self.color = color
+        self.games_played = games_played
+        self.mild_adjustable = mild_adjustable
+
+    def as_dict(self):
+        return {
+            'type': self.type,
+            'color': self.color,
+            'games_played': self.games_played,
+            'mild_adjustable': self.mild_adjustable
+        }
+
+def get_color_preference(player, round_number):
+    """
+    Return the player's ColorPreference:
+        type: 'absolute'|'strong'|'mild'|None
+        color: 'white'|'black'|None
+        games_played: int
+        mild_adjustable: bool
+    - mild_adjustable will be True for even rounds & even games_played (per FIDE note)
+      meaning the mild preference can be flipped in even rounds to reduce strong-strong clashes.
+    """
+    games_played = player.white_count + player.black_count
+    diff = player.color_diff
+    last_colors = player.last_colors or []
+    pref_type = None
+    pref_color = None
+    mild_adjustable = False
+
+    if games_played == 0:
+        return ColorPreference()
+
+    # ABSOLUTE: color difference > +1 or < -1 OR last two same color
+    if diff >= 2:
+        pref_type = 'absolute'
+        pref_color = 'black'
+    elif diff <= -2:
+        pref_type = 'absolute'
+        pref_color = 'white'
+    elif len(last_colors) >= 2 and last_colors[-1] == last_colors[-2]:
+        # If last two were same, preference is opposite color (absolute)
+        pref_type = 'absolute'
+        pref_color = 'white' if last_colors[-1] == 'black' else 'black'
+    else:
+        # STRONG if diff == +1 or -1
+        if diff == 1:
+            pref_type = 'strong'
+            pref_color = 'black'
+        elif diff == -1:
+            pref_type = 'strong'
+            pref_color = 'white'
+        else:
+            # MILD: diff == 0 or (no clear diff) -> alternate from last game
+            pref_type = 'mild'
+            if last_colors:
+                pref_color = 'black' if last_colors[-1] == 'white' else 'white'
+            else:
+                # By convention if no last color, mild prefer white (as before)
+                pref_color = 'white'
+
+    # Apply odd-round promotion: strong → absolute
+    if round_number % 2 == 1 and pref_type == 'strong':
+        pref_type = 'absolute'
+
+    # Even-round mild adjustable
+    if round_number % 2 == 0 and pref_type == 'mild' and games_played % 2 == 0:
+        mild_adjustable = True
+
+    return ColorPreference(pref_type, pref_color, games_played, mild_adjustable)
+
+def build_color_preference_table(players, round_number):
+    """One O(n) pass: player id -> ColorPreference for this round."""
+    return {p.id: get_color_preference(p, round_number) for p in players}
+
+class PlayedPairs:
+    """
+    Index of pairs that already met, stored as packed (min_id, max_id) integer keys
+    so the rematch check is a single set lookup instead of scanning opponent lists.
+    rematch_mask() answers the same question for a whole bracket at once.
+    """
+    __slots__ = ('_keys', '_packed')
+
+    def __init__(self):
+        self._keys = set()
+        self._packed = None
+
+    @staticmethod
+    def key(a, b):
+        return (a << 32) | b if a < b else (b << 32) | a
+
+    @classmethod
+    def from_players(cls, players):
+        played = cls()
+        for p in players:
+            for opp_id in p.opponents:
+                played.add(p.id, opp_id)
+        return played
+
+    def add(self, a, b):
+        self._keys.add(self.key(a, b))
+        self._packed = None
+
+    def has_played(self, a, b):
+        return self.key(a, b) in self._keys
+
+    def rematch_mask(self, ids):
+        """
+        Boolean matrix (needs NumPy): mask[i, j] is True when ids[i] and ids[j] already met.
+        Costs two binary searches per id plus a step per pair those ids played, instead
+        of a lookup per pair of ids.
+        """
+        if self._packed is None:
+            # Sorted, so the pairs whose lower id is a given player form one run
+            self._packed = np.sort(np.fromiter(self._keys, dtype=np.int64, count=len(self._keys)))
+        ids = np.asarray(ids, dtype=np.int64)
+        n = len(ids)
+        mask = np.zeros((n, n), dtype=bool)
+        if not n or not len(self._packed):
+            return mask
+        start = np.searchsorted(self._packed, ids << 32)
+        counts = np.searchsorted(self._packed, (ids + 1) << 32) - start
+        total = int(counts.sum())
+        if not total:
+            return mask
+        rows = np.repeat(np.arange(n), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        other = self._packed[np.repeat(start, counts) + offsets] & 0xFFFFFFFF
+        # Keep the pairs whose higher id is among ids too
+        order = np.argsort(ids)
+        sorted_ids = ids[order]
+        at = np.minimum(np.searchsorted(sorted_ids, other), n - 1)
+        inside = sorted_ids[at] == other
+        a = rows[inside]
+        b = order[at[inside]]
+        mask[a, b] = True
+        mask[b, a] = True
+        return mask
+
+    def __len__(self):
+        return len(self._keys)
+
+class CompatibilityGraph:
+    """
+    The rematch-free, color-legal compatibility graph of a round, indexable like
+    neighbour lists: graph[i] lists the players (by index) that players[i] may meet.
+    Rows are built on demand from per-player color restrictions, so a large open
+    never needs an n x n matrix.
+    """
+
+    def __init__(self, players, forbid_white, forbid_black):
+        self.n = len(players)
+        index = {p.id: i for i, p in enumerate(players)}
+        self.opponents = [set() for _ in players]
+        for i, p in enumerate(players):
+            for opp_id in p.opponents:
+                j = index.get(opp_id)
+                if j is not None:
+                    self.opponents[i].add(j)
+                    self.opponents[j].add(i)
+        self.forbid_white = forbid_white
+        self.forbid_black = forbid_black
+        if np is not None:
+            self._allow_white = ~np.array(forbid_white, dtype=bool)
+            self._allow_black = ~np.array(forbid_black, dtype=bool)
+
+    def has_edge(self, i, j):
+        if i == j or j in self.opponents[i]:
+            return False
+        return ((not self.forbid_white[i] and not self.forbid_black[j]) or
+                (not self.forbid_black[i] and not self.forbid_white[j]))
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if np is None:
+            return [j for j in range(self.n) if self.has_edge(i, j)]
+        ok = np.zeros(self.n, dtype=bool)
+        if not self.forbid_white[i]:
+            ok |= self._allow_black
+        if not self.forbid_black[i]:
+            ok |= self._allow_white
+        ok[i] = False
+        if self.opponents[i]:
+            ok[list(self.opponents[i])] = False
+        return np.flatnonzero(ok).tolist()
+
+
+# Global feasibility matchings of recent rounds, keyed by everything the
+# compatibility graph depends on, so pairing the same round again skips the search.
+FEASIBILITY_CACHE_SIZE = 32
+# Free players the greedy start of the feasibility matching tries by rank before
+# building a player's whole compatibility row
+FEASIBILITY_LOOKAHEAD = 16
+_feasibility_cache = OrderedDict()
+_feasibility_lock = threading.Lock()
+
+
+def clear_feasibility_cache():
+    """Forget the cached feasibility matchings (benchmarks measuring a cold round)."""
+    with _feasibility_lock:
+        _feasibility_cache.clear()
+
+
+def feasibility_key(players, round_number):
+    return (round_number,) + tuple(
+        (p.id, p.white_count, p.black_count, tuple(p.last_colors), tuple(sorted(p.opponents)))
+        for p in players)
+
+
+def global_feasibility_matching(graph, key=None):
+    """
+    Maximum-cardinality matching of the whole compatibility graph, as (mate, unmatched).
+    Starts from rank neighbours (players[2k] with players[2k+1]), greedily matches
+    whoever is left and only then searches for augmenting paths.
+    """
+    if key is not None:
+        with _feasibility_lock:
+            cached = _feasibility_cache.get(key)
+            if cached is not None:
+                _feasibility_cache.move_to_end(key)
+                return list(cached[0]), cached[1]
+
+    mate = [-1] * len(graph)
+    for i in range(0, len(graph) - 1, 2):
+        if graph.has_edge(i, i + 1):
+            mate[i], mate[i + 1] = i + 1, i
+    free = [i for i in range(len(graph)) if mate[i] == -1]
+    for k, i in enumerate(free):
+        if mate[i] != -1:
+            continue
+        # Same pick as scanning i's whole row (the first free neighbour, which always
+        # ranks below i), but the next few free players usually hold it and a row
+        # costs O(n) to build
+        j = next((j for j in free[k + 1:k + 1 + FEASIBILITY_LOOKAHEAD]
+                  if mate[j] == -1 and graph.has_edge(i, j)), None)
+        if j is None:
+            j = next((j for j in graph[i] if mate[j] == -1), None)
+        if j is not None:
+            mate[i], mate[j] = j, i
+    unmatched = max_cardinality_matching(graph, mate)
+
+    if key is not None:
+        with _feasibility_lock:
+            _feasibility_cache[key] = (tuple(mate), unmatched)
+            while len(_feasibility_cache) > FEASIBILITY_CACHE_SIZE:
+                _feasibility_cache.popitem(last=False)
+    return mate, unmatched
+
+def pair_round(players, round_number, pairing_method="matching", bye_points=1.0,
+               time_budget=ANYTIME_TIME_BUDGET, profile=None, feasibility_check=True):
+    """
+    FIDE Dutch Swiss System with corrected color preference & pairing behavior.
+
+    Key fixes:
+    - Proper classification of absolute / strong / mild preferences.
+    - Odd-round: treat 'strong' as 'absolute' (promote strong->absolute).
+    - Even-round: allow mild preferences (when player has even games played)
+      to be adjusted to reduce same-strong-color pairings.
+    - assign_colors follows FIDE priority order (absolute > strong > mild >
+      higher-ranked player's preference > fallback).
+    - Improved would_violate logic (prevents 3 same-colors-in-a-row and
+      prevents creating extreme imbalance).
+    - Pairing tries opposite preferences first, then mixes, then unavoidable same-pref pairs.
+    - Maintains float_history and bye logic similar to your original.
+    - pairing_method="matching" (default) pairs every bracket with a global
+      maximum-weight matching; "greedy" keeps the old top-half/bottom-half pass;
+      "anytime" runs the matching pass and then, for at most time_budget seconds,
+      backtracks over blocks of neighbouring pairings for fewer unpaired players
+      and a lower total pairing cost.
+    - Feasibility pre-check (rounds 2+, unless feasibility_check=False): a
+      maximum-cardinality matching of the whole rematch-free, color-legal graph
+      decides which floaters each bracket may hand down, so the lower brackets
+      always stay pairable and no more players are left over than unavoidable.
+
+    players is a list of PlayerState and is not modified. bye_points is what the
+    bye player scores. Pass a PairingProfile as profile to collect phase timings
+    and counters. Returns a PairingResult.
+    """
+    deadline = time.perf_counter() + time_budget
+    profile = profile or NULL_PROFILE
+    bye_player = None
+
+    with profile.phase('index_opponents'):
+        # Built once per round; both can_pair and bracket_cost_matrix check rematches against it
+        played = PlayedPairs.from_players(players)
+
+    # -------------------- COLOR PREF FUNCTIONS --------------------
+    # Preferences only depend on colors played before this round, so compute them once.
+    with profile.phase('color_preferences'):
+        color_prefs = build_color_preference_table(players, round_number)
+
+    def would_violate_color_rules(player, assigned_color,opponent=None):
+        """Check if assigning this color would violate rules."""
+
+        # Rule 2: Can't have same color 3 times in a row
+        if len(player.last_colors) >= 2:
+            if player.last_colors[-1] == player.last_colors[-2] == assigned_color:
+                return True
+        
+        # Rule 3: Check absolute preference (CRITICAL FIX)
+        pref = color_prefs[player.id]
+        if pref.type == 'absolute' and pref.color and pref.color != assigned_color:
+            return True
+        
+        return False
+
+    def can_pair(p1, p2):
+        """Check basic pairing legality: not previous opponents and color absolute conflict."""
+        if played.has_played(p1.id, p2.id):
+            return False
+
+        # Only disallow if absolutely cannot assign colors
+        for c1, c2 in [('white', 'black'), ('black', 'white')]:
+            if not would_violate_color_rules(p1, c1,opponent=p2) and not would_violate_color_rules(p2, c2,opponent=p1):
+                return True
+        return False
+
+    def colors_are_compatible(p1, p2):
+        """
+        Quick check: do the preferences want opposite colors?
+        If any has None preference, treat as compatible.
+        Takes into account promotion for odd-round inside get_color_preference.
+        """
+        pref1 = color_prefs[p1.id]
+        pref2 = color_prefs[p2.id]
+        if pref1.color is None or pref2.color is None:
+            return True
+        return pref1.color != pref2.color
+
+    def calculate_pairing_quality(p1, p2):
+        """
+        Heuristic quality measure (lower = better):
+        - Primary: minimize score difference (strict)
+        - Secondary: try to satisfy absolute/strong preferences by penalizing if they'd conflict
+        - Tertiary: prefer opposite preference pairs
+        - Additional: float penalties to discourage bad float directions
+        This is a heuristic used only to choose among many legal pairings.
+        """
+        score = 0
+        # Strong primary penalty for score difference so we don't pair widely separated players
+        score += abs(p1.score - p2.score) * 100000
+
+        pref1 = color_prefs[p1.id]
+        pref2 = color_prefs[p2.id]
+
+        # If one has absolute preference that would be violated by pairing assignment choices,
+        # add big penalty. We'll check both assignment directions.
+        # If there is at least one assignment direction that respects absolute prefs, it's okay.
+        absolute_violation = True
+        for c1, c2 in [('white', 'black'), ('black', 'white')]:
+            if pref1.type == 'absolute' and pref1.color != c1:
+                continue
+            if pref2.type == 'absolute' and pref2.color != c2:
+                continue
+            if would_violate_color_rules(p1, c1,opponent=p2) or would_violate_color_rules(p2, c2,opponent=p1):
+                continue
+            # found a legal assignment that doesn't violate absolute pref
+            absolute_violation = False
+            break
+        if absolute_violation:
+            score += 50000
+
+        # Penalize if both want the same color (makes pairing less desirable)
+        if pref1.color and pref2.color and pref1.color == pref2.color:
+            # heavier if one of them is absolute / strong
+            if pref1.type == 'absolute' or pref2.type == 'absolute':
+                score += 40000
+            elif pref1.type == 'strong' or pref2.type == 'strong':
+                score += 5000
+            else:
+                score += 1000
+        else:
+            # bonus slightly if they want opposite colors
+            if pref1.color and pref2.color and pref1.color != pref2.color:
+                score -= 500
+
+        # Float heuristics (avoid up-floating a lower player with a much higher score, etc.)
+        if p1.float_history and p1.float_history[-1] == 'down' and p1.score > p2.score:
+            score += 200
+        if p2.float_history and p2.float_history[-1] == 'up' and p2.score < p1.score:
+            score += 200
+
+        return score
+
+    def bracket_cost_matrix(players):
+        """
+        Batched calculate_pairing_quality/can_pair for a whole bracket.
+        Returns (cost, legal) as nested lists where cost[i][j] is
+        calculate_pairing_quality(players[i], players[j]) and legal[i][j] is
+        can_pair(players[i], players[j]). Uses NumPy when available.
+        """
+        if np is not None:
+            cost, legal = bracket_cost_arrays(players)
+            return cost.tolist(), legal.tolist()
+
+        n = len(players)
+        if profile.enabled:
+            profile.count('candidate_pairs', n * (n - 1) // 2)
+        cost = [[calculate_pairing_quality(p1, p2) for p2 in players] for p1 in players]
+        legal = [[i != j and can_pair(p1, p2) for j, p2 in enumerate(players)]
+                 for i, p1 in enumerate(players)]
+        if profile.enabled:
+            profile.count('legality_rejections', n * (n - 1) // 2 - sum(map(sum, legal)) // 2)
+        return cost, legal
+
+    def bracket_cost_arrays(players):
+        """bracket_cost_matrix as NumPy arrays: (cost, legal), both n x n."""
+        n = len(players)
+        if profile.enabled:
+            profile.count('candidate_pairs', n * (n - 1) // 2)
+        scores = np.array([p.score for p in players], dtype=float)
+        pref_color = np.zeros(n, dtype=np.int8)   # 0 none, 1 white, 2 black
+        pref_type = np.zeros(n, dtype=np.int8)    # 0 none, 1 mild, 2 strong, 3 absolute
+        forbid_white = np.zeros(n, dtype=bool)
+        forbid_black = np.zeros(n, dtype=bool)
+        floated_down = np.zeros(n, dtype=bool)
+        floated_up = np.zeros(n, dtype=bool)
+        rematch = played.rematch_mask([p.id for p in players])
+
+        for i, p in enumerate(players):
+            pref = color_prefs[p.id]
+            pref_color[i] = COLOR_CODES.get(pref.color, 0)
+            pref_type[i] = PREFERENCE_CODES.get(pref.type, 0)
+            forbid_white[i] = would_violate_color_rules(p, 'white')
+            forbid_black[i] = would_violate_color_rules(p, 'black')
+            if p.float_history:
+                floated_down[i] = p.float_history[-1] == 'down'
+                floated_up[i] = p.float_history[-1] == 'up'
+
+        # An assignment direction works when neither player's color is forbidden
+        white_black = ~forbid_white[:, None] & ~forbid_black[None, :]
+        black_white = ~forbid_black[:, None] & ~forbid_white[None, :]
+        absolute_violation = ~(white_black | black_white)
+
+        legal = ~rematch & ~absolute_violation
+        np.fill_diagonal(legal, False)
+        if profile.enabled:
+            profile.count('legality_rejections', n * (n - 1) // 2 - int(legal.sum()) // 2)
+
+        both_prefer = (pref_color[:, None] > 0) & (pref_color[None, :] > 0)
+        same_color = both_prefer & (pref_color[:, None] == pref_color[None, :])
+        any_absolute = (pref_type[:, None] == 3) | (pref_type[None, :] == 3)
+        any_strong = (pref_type[:, None] == 2) | (pref_type[None, :] == 2)
+        color_penalty = np.where(same_color,
+                                 np.where(any_absolute, 40000, np.where(any_strong, 5000, 1000)),
+                                 np.where(both_prefer, -500, 0))
+
+        # Same order of additions as calculate_pairing_quality so results match exactly
+        higher = scores[:, None] > scores[None, :]
+        cost = np.abs(scores[:, None] - scores[None, :]) * 100000
+        cost += absolute_violation * 50000.0
+        cost += color_penalty
+        cost += (floated_down[:, None] & higher) * 200.0
+        cost += (floated_up[None, :] & higher) * 200.0
+
+        return cost, legal
+
+    def matching_edges(players, positions, n):
+        """
+        Weighted edges for max_weight_matching between players (local indices), where
+        positions[k] is players[k]'s place in its sorted bracket of n players. Pairs are scored from the higher-ranked side and, among equal
+        quality, the classic top-half vs bottom-half opponent weighs most. Above
+        MATCHING_FULL_GRAPH_LIMIT players only each player's MATCHING_NEIGHBOURS best
+        candidates are kept.
+        """
+        m = len(players)
+        half = n // 2
+        if np is None:
+            cost, legal = bracket_cost_matrix(players)
+            candidates = []
+            for i in range(m):
+                for j in range(i + 1, m):
+                    if legal[i][j]:
+                        deviation = abs(abs(positions[j] - positions[i]) - half)
+                        candidates.append((cost[i][j], deviation, i, j))
+            if m > MATCHING_FULL_GRAPH_LIMIT:
+                by_player = defaultdict(list)
+                for c in candidates:
+                    by_player[c[2]].append(c)
+                    by_player[c[3]].append(c)
+                kept = set()
+                for options in by_player.values():
+                    options.sort()
+                    kept.update(options[:MATCHING_NEIGHBOURS])
+                candidates = sorted(kept, key=lambda c: (c[2], c[3]))
+            if not candidates:
+                return []
+            worst = max(c[0] for c in candidates)
+            scale = (n // 2) * (n + 1) + 1
+            return [(i, j, int(round(worst - quality)) * scale + (n - deviation) + 1)
+                    for quality, deviation, i, j in candidates]
+
+        cost, legal = bracket_cost_arrays(players)
+        # Symmetric quality: the higher-ranked (lower position) player's row
+        quality = np.rint(np.triu(cost, 1)).astype(np.int64)
+        quality += quality.T
+        place = np.asarray(positions, dtype=np.int64)
+        deviation = np.abs(np.abs(place[None, :] - place[:, None]) - half)
+        keep = np.triu(legal, 1)
+        if m > MATCHING_FULL_GRAPH_LIMIT:
+            # Per player: order candidates by (quality, deviation, other player) and
+            # keep the best few; illegal pairs sort last and are dropped again below
+            key = (quality * (n + 1) + deviation) * m + np.arange(m)[None, :]
+            key[~legal] = np.iinfo(np.int64).max
+            k = min(MATCHING_NEIGHBOURS, m - 1)
+            best = np.argpartition(key, k - 1, axis=1)[:, :k]
+            near = np.zeros((m, m), dtype=bool)
+            near[np.arange(m)[:, None], best] = True
+            keep &= near | near.T
+        i, j = np.nonzero(keep)
+        if not len(i):
+            return []
+        quality = quality[i, j]
+        worst = quality.max()
+        scale = (n // 2) * (n + 1) + 1
+        weights = (worst - quality) * scale + (n - deviation[i, j]) + 1
+        return list(zip(i.tolist(), j.tolist(), weights.tolist()))
+
+    def assign_colors(p1, p2, round_number):
+        """
+        Assign colors following FIDE priority order.
+        Returns (white_player, black_player)
+        """
+        pref1 = color_prefs[p1.id]
+        pref2 = color_prefs[p2.id]
+
+        def valid_assignment(white, black):
+            return (not would_violate_color_rules(white, 'white', opponent=black) and 
+                    not would_violate_color_rules(black, 'black', opponent=white))
+
+        # Priority 1: Both absolute with opposite preferences
+        if pref1.type == 'absolute' and pref2.type == 'absolute':
+            if pref1.color == 'white' and pref2.color == 'black':
+                if valid_assignment(p1, p2):
+                    return p1, p2
+            elif pref1.color == 'black' and pref2.color == 'white':
+                if valid_assignment(p2, p1):
+                    return p2, p1
+
+        # Priority 2: One absolute preference
+        if pref1.type == 'absolute' and pref1.color:
+            if pref1.color == 'white' and valid_assignment(p1, p2):
+                return p1, p2
+            elif pref1.color == 'black' and valid_assignment(p2, p1):
+                return p2, p1
+
+        if pref2.type == 'absolute' and pref2.color:
+            if pref2.color == 'white' and valid_assignment(p2, p1):
+                return p2, p1
+            elif pref2.color == 'black' and valid_assignment(p1, p2):
+                return p1, p2
+
+        # Priority 3: Both strong with opposite preferences
+        if pref1.type == 'strong' and pref2.type == 'strong':
+            if pref1.color == 'white' and pref2.color == 'black':
+                if valid_assignment(p1, p2):
+                    return p1, p2
+            elif pref1.color == 'black' and pref2.color == 'white':
+                if valid_assignment(p2, p1):
+                    return p2, p1
+
+        # Priority 4: One strong preference
+        if pref1.type == 'strong' and pref1.color:
+            if pref1.color == 'white' and valid_assignment(p1, p2):
+                return p1, p2
+            elif pref1.color == 'black' and valid_assignment(p2, p1):
+                return p2, p1
+
+        if pref2.type == 'strong' and pref2.color:
+            if pref2.color == 'white' and valid_assignment(p2, p1):
+                return p2, p1
+            elif pref2.color == 'black' and valid_assignment(p1, p2):
+                return p1, p2
+
+        # Priority 5: Both mild with opposite preferences
+        if pref1.type == 'mild' and pref2.type == 'mild':
+            if pref1.color == 'white' and pref2.color == 'black':
+                if valid_assignment(p1, p2):
+                    return p1, p2
+            elif pref1.color == 'black' and pref2.color == 'white':
+                if valid_assignment(p2, p1):
+                    return p2, p1
+        
+        # Priority 6: One mild preference
+        if pref1.type == 'mild' and pref1.color:
+            if pref1.color == 'white' and valid_assignment(p1, p2):
+                return p1, p2
+            elif pref1.color == 'black' and valid_assignment(p2, p1):
+                return p2, p1
+
+        if pref2.type == 'mild' and pref2.color:
+            if pref2.color == 'white' and valid_assignment(p2, p1):
+                return p2, p1
+            elif pref2.color == 'black' and valid_assignment(p1, p2):
+                return p1, p2
+
+        # Priority 7: Higher-ranked player preference
+        higher = p1 if (p1.score > p2.score or (p1.score == p2.score and getattr(p1, 'elo', 0) >= getattr(p2, 'elo', 0))) else p2
+        lower = p2 if higher == p1 else p1
+        
+        h_pref = color_prefs[higher.id]
+        if h_pref.color == 'white' and valid_assignment(higher, lower):
+            return higher, lower
+        elif h_pref.color == 'black' and valid_assignment(lower, higher):
+            return lower, higher
+
+        # Priority 8: Minimize color imbalance
+        candidates = []
+        for (w, b) in [(p1, p2), (p2, p1)]:
+            if valid_assignment(w, b):
+                w_new_diff = abs((w.white_count + 1) - w.black_count)
+                b_new_diff = abs(b.white_count - (b.black_count + 1))
+                candidates.append(((w, b), w_new_diff + b_new_diff))
+        
+        if candidates:
+            candidates.sort(key=lambda x: x[1])
+            return candidates[0][0]
+
+        # Fallback
+        if valid_assignment(p1, p2):
+            return p1, p2
+        return p2, p1
+
+    def select_bye_player(players):
+        """Select bye recipient - lowest score, fewest byes, hasn't had bye recently; tie-break on higher id."""
+        # Prioritize players who haven't had a bye yet (bye_count = 0)
+        eligible = [p for p in players if getattr(p, 'bye_count', 0) == 0]
+        
+        if not eligible:
+            # If everyone has had at least one bye, pick the one with fewest byes
+            eligible = players[:]
+        
+        # Sort by: lowest score first, then fewest byes, then highest ID (for tiebreak)
+        eligible.sort(key=lambda x: (x.score, getattr(x, 'bye_count', 0), -x.id))
+        return eligible[0]
+
+
+    
+    def swiss_pairings_round_1(players):
+        """
+        Round 1 special pairing: Sort by ELO, pair top half vs bottom half.
+        Highest ELO plays against median ELO.
+        Returns list of pairings (no bye in round 1 for even players).
+        """
+        # Sort by ELO (highest first), then by ID for tiebreak
+        sorted_players = sorted(players, key=lambda x: (-getattr(x, 'elo', 1000), x.id))
+    
+        n = len(sorted_players)
+        pairs = []
+    
+        for i in range(0, n, 2):
+            if i + 1 < n: 
+                p1 = sorted_players[i]
+                p2 = sorted_players[i+1]
+                pairs.append((p1, p2))
+    
+        return pairs
+
+    # -------------------- BRACKET PAIRING --------------------
+    def pair_bracket_with_color_priority(players):
+        """
+        Pair players inside a score bracket while prioritizing satisfying absolute/strong prefs
+        and trying to match opposite preferences first.
+        Returns (pairs_list, floaters_list)
+        """
+        if len(players) < 2:
+            return [], players[:]
+
+        # sort by FIDE typical order: higher score first (already bracket), then higher elo, lower id last
+        players = sorted(players, key=lambda x: (-x.score, -getattr(x, 'elo', 0), x.id))
+
+        n = len(players)
+        pairs = []
+        used = set()
+        cost, legal = bracket_cost_matrix(players)
+        index = {p.id: i for i, p in enumerate(players)}
+
+            # Split into top and bottom half for initial attempt
+        mid = n // 2
+        top_half = [p for p in players[:mid] if p.id not in used]
+        bottom_half = [p for p in players[mid:] if p.id not in used]
+    
+        # Try pairing top half with bottom half first (classic Swiss approach)
+        for i, p_top in enumerate(top_half):
+            if p_top.id in used:
+                continue
+        
+            # Try to find best match from bottom half
+            best_partner = None
+            best_quality = float('inf')
+
+            for p_bottom in bottom_half:
+                if p_bottom.id in used:
+                    continue
+                if not legal[index[p_top.id]][index[p_bottom.id]]:
+                    continue
+                try:
+                    white,black = assign_colors(p_top,p_bottom,round_number)
+                except Exception:
+                    continue
+            
+                quality = cost[index[white.id]][index[black.id]]
+                if quality < best_quality:
+                    best_quality = quality
+                    best_partner = p_bottom
+        
+            if best_partner:
+                pairs.append((p_top, best_partner))
+                used.add(p_top.id)
+                used.add(best_partner.id)
+    
+        # For remaining unpaired players, use consecutive pairing with lookahead
+        remaining = [p for p in players if p.id not in used]
+
+        i=0
+        while i < len(remaining) -1:
+            p1=remaining[i]
+            if p1.id in used:
+                i +=1
+                continue
+
+            # Try next available partners (lookahead up to 5 positions)
+            best_partner = None
+            best_quality = float('inf')
+            
+            for j in range(i+1,len(remaining)):
+                    p2 = remaining[j]
+                    if p2.id in used:
+                        continue
+
+                    if not legal[index[p1.id]][index[p2.id]]:
+                        continue
+
+                    quality = cost[index[p1.id]][index[p2.id]]
+
+                    # Slight preference for consecutive pairing (maintain bracket order)
+                    if j == i + 1:
+                        quality -= 500
+            
+                    if quality < best_quality:
+                        best_quality = quality
+                        best_partner = p2
+        
+            if best_partner:
+                pairs.append((p1, best_partner))
+                used.add(p1.id)
+                used.add(best_partner.id)
+
+            i +=1
+        floaters = [p for p in players if p.id not in used]  # leftover unpaired players
+        return pairs, floaters
+
+    def pair_bracket_by_matching(players):
+        """
+        Pair a score bracket in one optimal pass.
+        Builds the weighted compatibility graph from the bracket cost matrix (can_pair
+        for legality, calculate_pairing_quality for weights) and solves it as a maximum-cardinality,
+        maximum-weight matching, so the bracket leaves as few floaters as possible.
+
+        Brackets above MATCHING_WINDOW players are matched window by window: the k-th
+        slice of the top half with the k-th slice of the bottom half (the opponents the
+        classic pairing would give them), plus whoever the previous window left over.
+        Augmenting paths across the whole bracket then pair any leftovers that can
+        still be paired, so the floater count stays that of a single matching.
+        Returns (pairs_list, floaters_list)
+        """
+        if len(players) < 2:
+            return [], players[:]
+
+        players = sorted(players, key=lambda x: (-x.score, -getattr(x, 'elo', 0), x.id))
+        n = len(players)
+        half = n // 2
+        windows = -(-n // MATCHING_WINDOW)
+        step = -(-half // windows)
+
+        mate = [-1] * n
+        carry = []
+        for k in range(windows):
+            bottom_end = n if k == windows - 1 else min(half + (k + 1) * step, n)
+            members = (carry + list(range(k * step, min((k + 1) * step, half)))
+                       + list(range(half + k * step, bottom_end)))
+            members.sort()
+            # Weights are positive and "higher = better"; quality dominates, the
+            # deviation tie-break can never outweigh a single quality point.
+            edges = matching_edges([players[i] for i in members], members, n)
+            window_mate = max_weight_matching(edges, maxcardinality=True) if edges else []
+            carry = []
+            for a, i in enumerate(members):
+                b = window_mate[a] if a < len(window_mate) else -1
+                if b == -1:
+                    carry.append(i)
+                else:
+                    mate[i] = members[b]
+
+        if windows > 1 and len(carry) > 1:
+            graph = CompatibilityGraph(players,
+                                       [would_violate_color_rules(p, 'white') for p in players],
+                                       [would_violate_color_rules(p, 'black') for p in players])
+            max_cardinality_matching(graph, mate)
+
+        pairs = []
+        floaters = []
+        for i, p in enumerate(players):
+            if mate[i] == -1:
+                floaters.append(p)
+            elif i < mate[i]:
+                pairs.append((p, players[mate[i]]))
+        return pairs, floaters
+
+    # -------------------- ANYTIME SEARCH --------------------
+    def search_block(players, incumbent):
+        """
+        Best pairing of a block of players: fewest unpaired first, then the lowest
+        total pairing cost, found exactly as a maximum-cardinality matching with the
+        highest inverted cost. Returns (pairs, unpaired, improved); when that is no
+        better than the incumbent pairs, improved is False and they are kept.
+        """
+        players = sorted(players, key=lambda x: (-x.score, -getattr(x, 'elo', 0), x.id))
+        m = len(players)
+        index = {p.id: i for i, p in enumerate(players)}
+        cost, legal = bracket_cost_matrix(players)
+
+        def key(pairs):
+            # Pairs are scored from the higher-ranked side, as in matching_edges
+            return (m - 2 * len(pairs), sum(cost[min(i, j)][max(i, j)] for i, j in pairs))
+
+        candidates = [(i, j, int(round(cost[i][j]))) for i in range(m) for j in range(i + 1, m) if legal[i][j]]
+        found = []
+        if candidates:
+            worst = max(c for _, _, c in candidates)
+            mate = max_weight_matching([(i, j, worst - c + 1) for i, j, c in candidates], maxcardinality=True)
+            found = [(i, j) for i, j in enumerate(mate) if j > i]
+        improved = key(found) < key([(index[a.id], index[b.id]) for a, b in incumbent])
+        pairs = [(players[i], players[j]) for i, j in found] if improved else incumbent
+        paired = {p.id for pair in pairs for p in pair}
+        return pairs, [p for p in players if p.id not in paired], improved
+
+    def improve_pairings(pairs, unpaired, ranking):
+        """
+        Cut the finished round, in rank order, into blocks of size pairings / unpaired
+        players and solve each block again with search_block, keeping its pairs when
+        they leave fewer players unpaired or, with as many unpaired, cost less. A pass
+        that improves nothing is repeated with the blocks shifted by half a block, then
+        the block size doubles. Stops when the time budget runs out, when one block
+        held the whole field (the round is then optimal) or when blocks would outgrow
+        ANYTIME_MAX_WINDOW players without anything left to improve at this size.
+        Returns the best (pairs, unpaired) found.
+        """
+        rank = {p.id: k for k, p in enumerate(ranking)}
+        size = ANYTIME_INITIAL_WINDOW
+        offset = 0
+        while time.perf_counter() < deadline:
+            units = sorted(pairs + [(p,) for p in unpaired], key=lambda unit: min(rank[p.id] for p in unit))
+            if len(units) < 2:
+                break
+            pairs, unpaired = [], []
+            improved = False
+            bounds = sorted({0, *range(offset, len(units), size)}) + [len(units)]
+            for start, stop in zip(bounds, bounds[1:]):
+                block = units[start:stop]
+                incumbent = [unit for unit in block if len(unit) == 2]
+                if len(block) > 1 and time.perf_counter() < deadline:
+                    block_pairs, block_unpaired, better = search_block([p for unit in block for p in unit], incumbent)
+                    if better:
+                        profile.count('anytime_improvements')
+                        improved = True
+                    pairs.extend(block_pairs)
+                    unpaired.extend(block_unpaired)
+                else:
+                    pairs.extend(incumbent)
+                    unpaired.extend(unit[0] for unit in block if len(unit) == 1)
+            if improved:
+                continue
+            if size >= len(units):
+                break
+            if not offset:
+                offset = size // 2
+                continue
+            offset = 0
+            if 4 * size > ANYTIME_MAX_WINDOW:
+                break
+            size *= 2
+
+        pairs.sort(key=lambda pair: min(rank[pair[0].id], rank[pair[1].id]))
+        return pairs, unpaired
+
+    # -------------------- FEASIBILITY --------------------
+    def build_feasibility(pool):
+        """Compatibility graph of pool plus its (cached) global maximum-cardinality matching."""
+        graph = CompatibilityGraph(pool,
+                                   [would_violate_color_rules(p, 'white') for p in pool],
+                                   [would_violate_color_rules(p, 'black') for p in pool])
+        mate, unmatched = global_feasibility_matching(graph, feasibility_key(pool, round_number))
+        return {'pool': pool, 'graph': graph, 'mate': mate, 'slack': unmatched,
+                'index': {p.id: i for i, p in enumerate(pool)}}
+
+    def still_feasible(feasible, remaining):
+        """
+        Can the remaining players (indices) still be paired leaving at most the
+        unavoidable number unpaired? Warm-starts from the current matching and
+        commits the extended matching when they can.
+        """
+        inside = set(remaining)
+        trial = feasible['mate'][:]
+        for i in remaining:
+            if trial[i] != -1 and trial[i] not in inside:
+                trial[i] = -1
+        unmatched = max_cardinality_matching(feasible['graph'], trial, vertices=remaining,
+                                             max_unmatched=feasible['slack'])
+        if unmatched is None:
+            return False
+        feasible['mate'] = trial
+        return True
+
+    def settle_bracket(feasible, bracket, pairs, floaters, later):
+        """
+        Check a bracket's pairing against the feasibility matching. If the floaters
+        plus the lower brackets could no longer be paired, retry with every player
+        whose matching partner sits lower handed down, and as a last resort take the
+        matching's own pairs inside the bracket.
+        Returns (pairs, floaters).
+        """
+        index = feasible['index']
+        later_ids = [index[p.id] for p in later]
+        if still_feasible(feasible, [index[p.id] for p in floaters] + later_ids):
+            return pairs, floaters
+
+        profile.count('feasibility_repairs')
+        mate = feasible['mate']
+        bracket_ids = {index[p.id] for p in bracket}
+        forced = [p for p in bracket if mate[index[p.id]] not in bracket_ids]
+        forced_ids = {p.id for p in forced}
+        pairs, floaters = pair_bracket([p for p in bracket if p.id not in forced_ids])
+        floaters = floaters + forced
+        if still_feasible(feasible, [index[p.id] for p in floaters] + later_ids):
+            return pairs, floaters
+
+        # The matching restricted to the players still in play is itself feasible
+        pairs = [(p, feasible['pool'][mate[index[p.id]]]) for p in bracket
+                 if mate[index[p.id]] in bracket_ids and index[p.id] < mate[index[p.id]]]
+        floaters = forced
+        return pairs, floaters
+
+    if pairing_method == "greedy":
+        pair_bracket = pair_bracket_with_color_priority
+    else:
+        pair_bracket = pair_bracket_by_matching
+
+    # -------------------- MAIN --------------------
+    float_dirs = {}
+
+    # SPECIAL CASE: ROUND 1 - Pair by ELO
+    if round_number == 1:
+        players_for_pairing = players[:]
+        with profile.phase('bye_selection'):
+            if len(players) % 2 == 1:
+                bye_player = select_bye_player(players)
+                players_for_pairing = [p for p in players if p.id != bye_player.id]
+
+        colored_pairs = []
+        with profile.phase('round1_pairing'):
+            for p1, p2 in swiss_pairings_round_1(players_for_pairing):
+                # For round 1, higher ELO gets white (or alternate)
+                if getattr(p1, 'elo', 1000) >= getattr(p2, 'elo', 1000):
+                    colored_pairs.append((p1, p2))
+                else:
+                    colored_pairs.append((p2, p1))
+    else:
+        # ROUNDS 2+: Standard Swiss system by score brackets
+        sorted_players = sorted(players, key=lambda x: (-x.score, -getattr(x, 'elo', 0), x.id))
+        score_brackets = defaultdict(list)
+        for p in sorted_players:
+            score_brackets[p.score].append(p)
+        scores = sorted(score_brackets.keys(), reverse=True)
+
+        with profile.phase('bye_selection'):
+            if len(sorted_players) % 2 == 1:
+                bye_player = select_bye_player(sorted_players[:])
+
+        def record_floats(pairs):
+            for p1, p2 in pairs:
+                if p1.score > p2.score:
+                    float_dirs[p1.id] = 'down'
+                    float_dirs[p2.id] = 'up'
+                elif p2.score > p1.score:
+                    float_dirs[p2.id] = 'down'
+                    float_dirs[p1.id] = 'up'
+                else:
+                    float_dirs[p1.id] = None
+                    float_dirs[p2.id] = None
+
+        pool = [p for p in sorted_players if p is not bye_player]
+        feasible = None
+        if feasibility_check:
+            with profile.phase('feasibility'):
+                feasible = build_feasibility(pool)
+
+        all_pairs = []
+        floaters = []
+        seen = 0
+
+        # Process each score bracket
+        with profile.phase('bracket_pairing'):
+            for score in scores:
+                bracket_players = [p for p in score_brackets[score] if p is not bye_player]
+                seen += len(bracket_players)
+                # add floaters from previous higher bracket
+                bracket_players.extend(floaters)
+                floaters = []
+
+                if len(bracket_players) < 2:
+                    floaters = bracket_players
+                    profile.bracket(score, len(bracket_players), len(floaters))
+                    continue
+
+                pairs, new_floaters = pair_bracket(bracket_players)
+                if feasible:
+                    pairs, new_floaters = settle_bracket(feasible, bracket_players, pairs,
+                                                         new_floaters, pool[seen:])
+                all_pairs.extend(pairs)
+                floaters = new_floaters
+                profile.bracket(score, len(bracket_players), len(floaters))
+
+        # Try to pair remaining floaters across brackets if possible
+        with profile.phase('floater_pass'):
+            if len(floaters) >= 2:
+                remaining_pairs, leftover = pair_bracket(floaters)
+                if feasible:
+                    remaining_pairs, leftover = settle_bracket(feasible, floaters, remaining_pairs,
+                                                               leftover, [])
+                all_pairs.extend(remaining_pairs)
+                floaters = leftover
+
+        if pairing_method == "anytime":
+            with profile.phase('anytime_search'):
+                all_pairs, floaters = improve_pairings(all_pairs, floaters, sorted_players)
+        profile.count('unpaired', len(floaters))
+
+        record_floats(all_pairs)
+
+        with profile.phase('assign_colors'):
+            colored_pairs = [assign_colors(p1, p2, round_number) for p1, p2 in all_pairs]
+
+    # -------------------- FINALIZE PAIRINGS -----------------
+    pairings = []
+    deltas = {}
+    for white, black in colored_pairs:
+        deltas[white.id] = StateDelta(opponent_id=black.id, color='white',
+                                      float_dir=float_dirs.get(white.id),
+                                      record_float=white.id in float_dirs)
+        deltas[black.id] = StateDelta(opponent_id=white.id, color='black',
+                                      float_dir=float_dirs.get(black.id),
+                                      record_float=black.id in float_dirs)
+        pairings.append({
+            "white_id": white.id,
+            "white_name": white.name,
+            "black_id": black.id,
+            "black_name": black.name,
+            "result": None
+        })
+
+    if bye_player:
+        deltas[bye_player.id] = StateDelta(float_dir='down', record_float=True,
+                                           bye=True, score_delta=bye_points)
+
+    return PairingResult(pairings, bye_player.id if bye_player else None, deltas,
+                         profile if profile.enabled else None)
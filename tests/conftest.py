@@ -0,0 +1,37 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.py opens its database at import time; point it at a throwaway file, not db/db.sqlite3
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='swiss-tests-'), 'test.sqlite3')
+
+_names = itertools.count(1)
+
+
+@pytest.fixture
+def swiss():
+    """The app module, inside an app context."""
+    import app as swiss
+    with swiss.app.app_context():
+        yield swiss
+        swiss.db.session.rollback()
+
+
+@pytest.fixture
+def make_tournament(swiss):
+    """make_tournament(players, rounds=5) -> a committed Tournament with that many participants."""
+    def make(players, rounds=5):
+        tournament = swiss.Tournament(name=f"Test {next(_names)}", rounds=rounds, max_players=players)
+        swiss.db.session.add(tournament)
+        swiss.db.session.flush()
+        swiss.db.session.add_all(swiss.Participant(name=f"Player {i + 1}", elo=2000 - 10 * i,
+                                                   tournament_id=tournament.id)
+                                 for i in range(players))
+        swiss.db.session.commit()
+        return tournament
+    return make
@@ -0,0 +1,157 @@
+import json
+import time
+from urllib.parse import quote
+
+
+def standings_url(tournament):
+    return f"/api/tournament/{quote(tournament.name)}/standings"
+
+
+def test_standings_revalidate_and_share_one_cache_entry(swiss, make_tournament):
+    tournament = make_tournament(8)
+    ok, message = swiss.generate_next_round(tournament.id)
+    assert ok, message
+    client = swiss.app.test_client()
+    url = standings_url(tournament)
+
+    first = client.get(url + '?limit=3&fields=rank,name')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert client.get(url + '?limit=3&fields=rank,name', headers={'If-None-Match': etag}).status_code == 304
+
+    # The same parsed arguments in any spelling are one cache entry
+    swiss._response_cache.clear()
+    for query in ('?limit=3&fields=rank,name', '?fields=rank,name&limit=3', '?limit=3&cursor=0&fields=rank,name&x=1'):
+        assert client.get(url + query).get_json() == first.get_json()
+    assert len(swiss._response_cache) == 1
+
+    # A new result moves the version on, so the old ETag no longer matches
+    swiss.apply_round_results(tournament.id, 1, [{'board': 1, 'result': 'draw'}])
+    changed = client.get(url + '?limit=3&fields=rank,name', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_a_stalled_event_subscriber_is_dropped(swiss, make_tournament, monkeypatch):
+    monkeypatch.setitem(swiss.app.config, 'EVENT_QUEUE_SIZE', 4)
+    monkeypatch.setitem(swiss.app.config, 'EVENT_POLL_INTERVAL', 0.01)
+    tournament = make_tournament(8)
+    subscription = swiss.change_feed.subscribe(tournament.id)
+    try:
+        # round + standings, then four results + standings: more than the queue holds
+        ok, message = swiss.generate_next_round(tournament.id)
+        assert ok, message
+        version = swiss.tournament_version(swiss.Tournament.id == tournament.id).data_version
+        report = swiss.apply_round_results(tournament.id, 1, [{'board': b, 'result': 'draw'} for b in (1, 2, 3, 4)])
+        assert report['updated'] == 4
+
+        deadline = time.time() + 10
+        while subscription in swiss.change_feed.subscribers.get(tournament.id, ()) and time.time() < deadline:
+            time.sleep(0.01)
+        events = [subscription.get_nowait() for _ in range(subscription.qsize())]
+    finally:
+        swiss.change_feed.unsubscribe(tournament.id, subscription)
+
+    assert [event[1] for event in events[:-1]] == ['round', 'standings', 'result']
+    assert events[-1] is None
+    # The standings event carries the version only, not the rows
+    assert json.loads(events[1][2]) == {'version': version, 'players': 8}
+
+
+def test_bulk_results_report_errors_and_skip_repeats(swiss, make_tournament):
+    tournament = make_tournament(8)
+    ok, message = swiss.generate_next_round(tournament.id)
+    assert ok, message
+    board4 = swiss.Game.query.filter_by(tournament_id=tournament.id, round_number=1, board=4).one()
+    client = swiss.app.test_client()
+    url = f"/api/tournament/{tournament.id}/rounds/1/results"
+    valid = [{'board': 1, 'result': 'white'}, {'board': 2, 'result': 'draw'},
+             {'white_id': board4.white_id, 'black_id': board4.black_id, 'result': 'black'}]
+
+    report = client.post(url, json={'results': valid[:2] + [{'board': 99, 'result': 'white'},
+                                                            {'board': 3, 'result': 'win'}] + valid[2:]}).get_json()
+    assert report['status'] == 'partial'
+    assert (report['updated'], report['unchanged']) == (3, 0)
+    assert [error['index'] for error in report['errors']] == [2, 3]
+    swiss.db.session.rollback()
+    scores = {p.id: p.score for p in swiss.Participant.query.filter_by(tournament_id=tournament.id)}
+    assert sum(scores.values()) == 3.0
+
+    # Sending the same results again adds no points
+    report = client.post(url, json=valid).get_json()
+    assert report['status'] == 'ok'
+    assert (report['updated'], report['unchanged'], report['errors']) == (0, 3, [])
+    swiss.db.session.rollback()
+    assert {p.id: p.score for p in swiss.Participant.query.filter_by(tournament_id=tournament.id)} == scores
+
+
+def test_standings_pages_follow_next_cursor(swiss, make_tournament):
+    tournament = make_tournament(8)
+    ok, message = swiss.generate_next_round(tournament.id)
+    assert ok, message
+    swiss.apply_round_results(tournament.id, 1, [{'board': b, 'result': 'white'} for b in (1, 2, 3, 4)])
+    client = swiss.app.test_client()
+    url = standings_url(tournament)
+
+    everyone = client.get(url).get_json()
+    assert 'next_cursor' not in everyone
+    pages, cursor = [], 0
+    while cursor is not None:
+        page = client.get(url + f'?limit=3&cursor={cursor}').get_json()
+        assert page['limit'] == 3 and len(page['standings']) <= 3
+        pages.append(page['standings'])
+        cursor = page['next_cursor']
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert [row for page in pages for row in page] == everyone['standings']
+
+
+def test_a_second_next_round_request_returns_the_queued_job(swiss, make_tournament, monkeypatch):
+    tournament = make_tournament(8)
+    client = swiss.app.test_client()
+    url = f"/api/tournament/{tournament.id}/rounds/next"
+
+    # Keep the worker from picking the job up until both requests are in
+    monkeypatch.setattr(swiss.round_jobs, 'wake', lambda: None)
+    first = client.post(url)
+    second = client.post(url)
+    assert (first.status_code, second.status_code) == (202, 202)
+    assert first.get_json()['status'] == 'queued'
+    assert second.get_json()['status'] == 'existing'
+    job_id = first.get_json()['job']['id']
+    assert second.get_json()['job']['id'] == job_id
+    assert second.headers['Location'].endswith(f"/api/jobs/{job_id}")
+
+    def poll():
+        # Requests share the test's session; end its read transaction to see the worker's commits
+        swiss.db.session.rollback()
+        return client.get(f"/api/jobs/{job_id}").get_json()
+
+    monkeypatch.undo()
+    swiss.round_jobs.wake()
+    deadline = time.time() + 30
+    job = poll()
+    while job['status'] in swiss.ROUND_JOB_ACTIVE and time.time() < deadline:
+        time.sleep(0.05)
+        job = poll()
+    assert job['status'] == 'done'
+    assert swiss.RoundJob.query.filter_by(tournament_id=tournament.id).count() == 1
+    assert swiss.Round.query.filter_by(tournament_id=tournament.id).count() == 1
+
+
+def test_upsert_import_reports_inserted_updated_and_unchanged(swiss, make_tournament):
+    tournament = make_tournament(4)
+    tournament.max_players = 6
+    swiss.db.session.commit()
+    client = swiss.app.test_client()
+
+    body = "name,elo\nPlayer 1,2000\nPlayer 2,1500\nNewcomer,1800\nPlayer 3,abc\nPlayer 1,1900\n"
+    report = client.post(f"/api/tournament/{quote(tournament.name)}/participants/import?mode=upsert",
+                         data=body, content_type='text/csv').get_json()
+    assert report['mode'] == 'upsert'
+    assert report['status'] == 'partial'
+    assert (report['inserted'], report['updated'], report['unchanged'], report['error_count']) == (1, 1, 1, 2)
+    assert [error['line'] for error in report['errors']] == [5, 6]
+
+    swiss.db.session.rollback()
+    players = {p.name: p.elo for p in swiss.Participant.query.filter_by(tournament_id=tournament.id)}
+    assert players == {'Player 1': 2000, 'Player 2': 1500, 'Player 3': 1980, 'Player 4': 1970, 'Newcomer': 1800}
@@ -0,0 +1,91 @@
+import itertools
+import random
+from functools import lru_cache
+
+import pytest
+
+from matching import max_cardinality_matching, max_weight_matching
+
+
+def random_graph(rng, n, density):
+    return [(i, j) for i, j in itertools.combinations(range(n), 2) if rng.random() < density]
+
+
+def brute_force_matching(vertices, weight, by_cardinality):
+    """
+    (cardinality, weight) of the best matching over vertices, by trying them all;
+    the most pairs first when by_cardinality, else simply the heaviest.
+    """
+    def key(option):
+        return option if by_cardinality else option[1]
+
+    @lru_cache(None)
+    def best(rest):
+        if not rest:
+            return (0, 0)
+        v, rest = rest[0], rest[1:]
+        result = best(rest)
+        for k, u in enumerate(rest):
+            if (v, u) in weight:
+                card, total = best(rest[:k] + rest[k + 1:])
+                option = (card + 1, total + weight[v, u])
+                if key(option) > key(result):
+                    result = option
+        return result
+    return best(tuple(vertices))
+
+
+def check_mate(mate, vertices, adjacent):
+    for v in vertices:
+        if mate[v] != -1:
+            assert mate[mate[v]] == v
+            assert mate[v] in adjacent(v)
+
+
+@pytest.mark.parametrize('maxcardinality', [False, True])
+def test_max_weight_matching_is_optimal(maxcardinality):
+    rng = random.Random(11)
+    for _ in range(300):
+        n = rng.randint(2, 10)
+        edges = [(i, j, rng.randint(1, 30)) for i, j in random_graph(rng, n, 0.5)]
+        weight = {}
+        for i, j, w in edges:
+            weight[i, j] = weight[j, i] = w
+
+        mate = max_weight_matching(edges, maxcardinality=maxcardinality)
+        check_mate(mate, range(len(mate)), lambda v: {u for u in range(n) if (v, u) in weight})
+        pairs = [(v, u) for v, u in enumerate(mate) if u > v]
+        got = (len(pairs), sum(weight[pair] for pair in pairs))
+        expected = brute_force_matching(range(n), weight, maxcardinality)
+        if maxcardinality:
+            assert got == expected
+        else:
+            assert got[1] == expected[1]
+
+
+def test_max_cardinality_matching_is_maximum():
+    rng = random.Random(5)
+    for _ in range(500):
+        n = rng.randint(1, 11)
+        adjacent = [set() for _ in range(n)]
+        for a, b in random_graph(rng, n, rng.random()):
+            adjacent[a].add(b)
+            adjacent[b].add(a)
+        vertices = sorted(rng.sample(range(n), rng.randint(0, n))) if rng.random() < 0.5 else list(range(n))
+        # Start from a random partial matching inside the subset
+        mate = [-1] * n
+        for a in vertices:
+            for b in adjacent[a]:
+                if b in vertices and mate[a] == mate[b] == -1 and rng.random() < 0.3:
+                    mate[a], mate[b] = b, a
+
+        weight = {(a, b): 1 for a in range(n) for b in adjacent[a]}
+        cardinality, _ = brute_force_matching(vertices, weight, True)
+        expected = len(vertices) - 2 * cardinality
+
+        assert max_cardinality_matching([sorted(a) for a in adjacent], mate, vertices=vertices) == expected
+        check_mate(mate, vertices, lambda v: adjacent[v])
+        if expected:
+            fresh = [-1] * n
+            assert max_cardinality_matching([sorted(a) for a in adjacent], fresh, vertices=vertices,
+                                            max_unmatched=expected - 1) is None
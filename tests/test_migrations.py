@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from app import MIGRATIONS, unpack_colors, unpack_floats
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Schema and JSON columns as created by the original app.py, before any migration
+BASELINE_SCHEMA = """
+CREATE TABLE tournament (
+    id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL UNIQUE, rounds INTEGER NOT NULL,
+    max_players INTEGER NOT NULL, win_points FLOAT, draw_points FLOAT, loss_points FLOAT);
+CREATE TABLE participant (
+    id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, elo INTEGER,
+    tournament_id INTEGER NOT NULL REFERENCES tournament (id), score FLOAT, opponents TEXT,
+    white_count INTEGER, black_count INTEGER, last_colors TEXT, float_history TEXT, bye_count INTEGER);
+CREATE TABLE round (
+    id INTEGER PRIMARY KEY, tournament_id INTEGER NOT NULL REFERENCES tournament (id),
+    round_number INTEGER NOT NULL, pairings TEXT, bye_player_id TEXT);
+"""
+
+HISTORY = {
+    1: (['white', 'black'], [None, 'down']),
+    2: (['black', 'white'], [None, 'up']),
+    3: (['white', 'black'], []),
+    4: (['black', 'white'], [None]),
+    5: ([], ['down']),
+}
+
+
+def baseline_database(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO tournament VALUES (1, 'Club Open', 5, 10, 1.0, 0.5, 0.0)")
+    rounds = [
+        [{'white_id': 1, 'white_name': 'A', 'black_id': 2, 'black_name': 'B', 'result': 'white'},
+         {'white_id': 3, 'white_name': 'C', 'black_id': 4, 'black_name': 'D', 'result': 'draw'}],
+        [{'white_id': 2, 'white_name': 'B', 'black_id': 3, 'black_name': 'C', 'result': 'black'},
+         {'white_id': 4, 'white_name': 'D', 'black_id': 1, 'black_name': 'A', 'result': None}],
+    ]
+    opponents = {1: [2, 4], 2: [1, 3], 3: [4, 2], 4: [3, 1], 5: []}
+    scores = {1: 1.0, 2: 0.0, 3: 1.5, 4: 0.5, 5: 2.0}
+    for pid, (colors, floats) in HISTORY.items():
+        conn.execute("INSERT INTO participant VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?)",
+                     (pid, 'ABCDE'[pid - 1], 2000 - pid, scores[pid], json.dumps(opponents[pid]),
+                      colors.count('white'), colors.count('black'), json.dumps(colors), json.dumps(floats),
+                      1 if pid == 5 else 0))
+    for number, pairings in enumerate(rounds, start=1):
+        conn.execute("INSERT INTO round (tournament_id, round_number, pairings, bye_player_id) VALUES (1, ?, ?, ?)",
+                     (number, json.dumps(pairings), json.dumps([5])))
+    conn.commit()
+    conn.close()
+
+
+def start_app(path):
+    """Import app.py against the database in a fresh interpreter; the import runs the migrations."""
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + path)
+    return subprocess.run([sys.executable, '-c', 'import app'], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True).stdout
+
+
+def test_baseline_database_is_migrated_once(tmp_path):
+    path = str(tmp_path / 'baseline.sqlite3')
+    baseline_database(path)
+
+    assert 'Applied migration' in start_app(path)
+    assert os.path.exists(path + '.pre-v1.bak')
+
+    conn = sqlite3.connect(path)
+    assert [v for (v,) in conn.execute("SELECT version FROM schema_version ORDER BY version")] == \
+        [m[0] for m in MIGRATIONS]
+
+    games = conn.execute("SELECT round_number, board, white_id, black_id, result FROM game "
+                         "ORDER BY round_number, board").fetchall()
+    assert games == [(1, 1, 1, 2, 'white'), (1, 2, 3, 4, 'draw'), (2, 1, 2, 3, 'black'), (2, 2, 4, 1, None)]
+    assert conn.execute("SELECT COUNT(*) FROM round WHERE pairings IS NOT NULL").fetchone() == (0,)
+
+    for pid, colors, floats, legacy in conn.execute(
+            "SELECT id, color_history, float_codes, "
+            "coalesce(opponents, '') || coalesce(last_colors, '') || coalesce(float_history, '') FROM participant"):
+        assert (unpack_colors(colors), unpack_floats(floats)) == HISTORY[pid]
+        assert legacy == ''
+
+    indexes = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'ix_participant_tournament_score', 'ix_round_tournament_round', 'ix_game_tournament_round'} <= indexes
+    conn.close()
+
+    # A second start finds nothing left to do
+    assert 'Applied migration' not in start_app(path)
+
+
+def start_apps(path, workers):
+    """Import app.py in several interpreters at once against the same database."""
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + path)
+    procs = [subprocess.Popen([sys.executable, '-c', 'import app'], cwd=ROOT, env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+             for _ in range(workers)]
+    outputs = [proc.communicate() for proc in procs]
+    assert [proc.returncode for proc in procs] == [0] * workers, [err for _, err in outputs]
+    return ''.join(out for out, _ in outputs)
+
+
+def test_workers_starting_together_migrate_once(tmp_path):
+    path = str(tmp_path / 'baseline.sqlite3')
+    baseline_database(path)
+
+    output = start_apps(path, 4)
+    for version, description, _ in MIGRATIONS:
+        assert output.count(f"Applied migration {version}: {description}") == 1
+    assert os.path.exists(path + '.pre-v1.bak')
+
+    conn = sqlite3.connect(path)
+    assert [v for (v,) in conn.execute("SELECT version FROM schema_version ORDER BY version")] == \
+        [m[0] for m in MIGRATIONS]
+    assert conn.execute("SELECT COUNT(*) FROM game").fetchone() == (4,)
+    conn.close()
+
+
+def test_workers_starting_together_create_the_database_once(tmp_path):
+    path = str(tmp_path / 'new.sqlite3')
+
+    assert 'Applied migration' not in start_apps(path, 4)
+
+    conn = sqlite3.connect(path)
+    assert [v for (v,) in conn.execute("SELECT version FROM schema_version ORDER BY version")] == \
+        [m[0] for m in MIGRATIONS]
+    conn.close()
@@ -0,0 +1,147 @@
+import itertools
+import random
+from functools import lru_cache
+
+import pytest
+
+import pairing
+from pairing import PlayerState, get_color_preference, pair_round
+
+
+def forbidden_colors(player, round_number):
+    """Colors player may not get this round: a third in a row, or against an absolute preference."""
+    forbidden = set()
+    if len(player.last_colors) >= 2 and player.last_colors[-1] == player.last_colors[-2]:
+        forbidden.add(player.last_colors[-1])
+    pref = get_color_preference(player, round_number)
+    if pref.type == 'absolute' and pref.color:
+        forbidden.add('black' if pref.color == 'white' else 'white')
+    return forbidden
+
+
+def legal(p1, p2, round_number):
+    if p2.id in p1.opponents:
+        return False
+    f1, f2 = forbidden_colors(p1, round_number), forbidden_colors(p2, round_number)
+    return ('white' not in f1 and 'black' not in f2) or ('black' not in f1 and 'white' not in f2)
+
+
+def fewest_unpaired(players, round_number):
+    @lru_cache(None)
+    def best(rest):
+        if not rest:
+            return 0
+        p, rest = rest[0], rest[1:]
+        result = 1 + best(rest)
+        for k, q in enumerate(rest):
+            if legal(p, q, round_number):
+                result = min(result, best(rest[:k] + rest[k + 1:]))
+        return result
+    return best(tuple(players))
+
+
+def crowded_field(rng, size, round_number):
+    """Players after round_number - 1 rounds with many random past meetings, so few pairings remain."""
+    players = [PlayerState(i + 1, name=f"P{i + 1}", elo=rng.randint(1200, 2200)) for i in range(size)]
+    for p, q in itertools.combinations(players, 2):
+        if len(p.opponents) < round_number - 1 and len(q.opponents) < round_number - 1 and rng.random() < 0.6:
+            p.opponents.append(q.id)
+            q.opponents.append(p.id)
+    for p in players:
+        colors = [rng.choice(['white', 'black']) for _ in p.opponents]
+        p.last_colors = colors
+        p.white_count = colors.count('white')
+        p.black_count = colors.count('black')
+        p.score = float(rng.randint(0, len(colors)))
+    return players
+
+
+@pytest.mark.parametrize('method', ['matching', 'greedy'])
+def test_pairing_leaves_only_the_unavoidable_players_unpaired(method):
+    rng = random.Random(3)
+    dead_ends = 0
+    for _ in range(150):
+        round_number = rng.randint(3, 6)
+        players = crowded_field(rng, rng.randint(4, 12), round_number)
+        by_id = {p.id: p for p in players}
+
+        result = pair_round(players, round_number, pairing_method=method)
+        pool = [p for p in players if p.id != result.bye_id]
+        for match in result.pairings:
+            assert legal(by_id[match['white_id']], by_id[match['black_id']], round_number)
+        unpaired = len(pool) - 2 * len(result.pairings)
+        assert unpaired == fewest_unpaired(pool, round_number)
+
+        unchecked = pair_round(players, round_number, pairing_method=method, feasibility_check=False)
+        dead_ends += len(players) - 2 * len(unchecked.pairings) - (unchecked.bye_id is not None) > unpaired
+
+    # Without the pre-check some of these fields do dead-end
+    assert dead_ends
+
+
+@pytest.mark.parametrize('size, round_number, window', [
+    (12, 4, 32),
+    (60, 5, 32),
+    # One matching for brackets above MATCHING_FULL_GRAPH_LIMIT, so the neighbour pruning runs
+    (200, 3, 1000),
+])
+def test_numpy_costs_match_the_per_pair_scoring(monkeypatch, size, round_number, window):
+    if pairing.np is None:
+        pytest.skip("NumPy is not installed")
+    monkeypatch.setattr(pairing, 'MATCHING_WINDOW', window)
+    rng = random.Random(size)
+    players = crowded_field(rng, size, round_number)
+    for p in players:
+        p.float_history = [rng.choice([None, 'down', 'up']) for _ in p.opponents]
+
+    def run():
+        # Every edge weight carries the pair's legality and rounded cost
+        graphs = []
+        matcher = pairing.max_weight_matching
+
+        def recording(edges, maxcardinality=False):
+            graphs.append(sorted(edges))
+            return matcher(edges, maxcardinality)
+
+        with monkeypatch.context() as m:
+            m.setattr(pairing, 'max_weight_matching', recording)
+            result = pair_round(players, round_number)
+        return graphs, result.pairings
+
+    vectorized = run()
+    monkeypatch.setattr(pairing, 'np', None)
+    assert run() == vectorized
+
+
+def score_quality(result, players):
+    """(unpaired, total score difference): the whole pairing cost when nobody has a color history."""
+    by_id = {p.id: p for p in players}
+    unpaired = len(players) - 2 * len(result.pairings) - (result.bye_id is not None)
+    return unpaired, sum(abs(by_id[m['white_id']].score - by_id[m['black_id']].score) for m in result.pairings)
+
+
+def test_anytime_improves_on_the_bracket_matching():
+    # Player 5 leads on 2 points with 9 and 10 but already met 4, the only player on 1.
+    # Bracket by bracket, 9-10 is paired and 5 and 4 both float down to the zeros;
+    # pairing 5-10 and 9-4 instead costs a single point of score difference.
+    history = {1: (0, [2, 3]), 2: (0, [1, 6]), 3: (0, [1, 6]), 4: (1, [5, 7]), 5: (2, [4, 7]), 6: (0, [2, 3]),
+               7: (0, [4, 5]), 8: (0, [9, 11]), 9: (2, [8, 11]), 10: (2, []), 11: (0, [8, 9])}
+    players = [PlayerState(i, name=f"P{i}", elo=2000 - 10 * i, score=float(score), opponents=opponents)
+               for i, (score, opponents) in history.items()]
+
+    matching = score_quality(pair_round(players, 3), players)
+    anytime = score_quality(pair_round(players, 3, pairing_method='anytime', time_budget=5), players)
+    assert matching == (0, 3.0)
+    assert anytime == (0, 1.0)
+
+
+def test_anytime_never_does_worse_than_matching():
+    rng = random.Random(8)
+    for _ in range(100):
+        round_number = rng.randint(3, 5)
+        players = crowded_field(rng, rng.randint(6, 16), round_number)
+        for p in players:
+            p.last_colors, p.white_count, p.black_count = [], 0, 0
+        matching = score_quality(pair_round(players, round_number), players)
+        anytime = score_quality(pair_round(players, round_number, pairing_method='anytime', time_budget=5), players)
+        assert anytime <= matching
@@ -0,0 +1,47 @@
+import json
+import random
+
+from sqlalchemy import inspect, text
+
+
+def test_colors_and_floats_pack_round_trip(swiss):
+    rng = random.Random(7)
+    for _ in range(200):
+        colors = [rng.choice(['white', 'black']) for _ in range(rng.randint(0, 80))]
+        floats = [rng.choice([None, 'down', 'up']) for _ in range(rng.randint(0, 20))]
+        # Only the most recent colors fit the packed integer
+        assert swiss.unpack_colors(swiss.pack_colors(colors)) == colors[-swiss.MAX_PACKED_COLORS:]
+        assert swiss.unpack_floats(swiss.pack_floats(floats)) == floats
+
+
+def test_legacy_json_history_decodes_to_the_same_player_state(swiss, make_tournament):
+    db = swiss.db
+    existing = {c['name'] for c in inspect(db.session.connection()).get_columns('participant')}
+    for column in ('opponents', 'last_colors', 'float_history'):
+        if column not in existing:
+            db.session.execute(text(f"ALTER TABLE participant ADD COLUMN {column} TEXT"))
+    db.session.commit()
+
+    tournament = make_tournament(6)
+    rng = random.Random(2)
+    legacy = {}
+    for p in swiss.Participant.query.filter_by(tournament_id=tournament.id):
+        colors = [rng.choice(['white', 'black']) for _ in range(rng.randint(0, 9))]
+        floats = [rng.choice([None, 'down', 'up']) for _ in range(rng.randint(0, 4))]
+        legacy[p.id] = (colors, floats)
+        db.session.execute(text("UPDATE participant SET last_colors = :c, float_history = :f, "
+                                "color_history = NULL, float_codes = NULL WHERE id = :id"),
+                           {'c': json.dumps(colors), 'f': json.dumps(floats), 'id': p.id})
+    db.session.commit()
+
+    swiss.begin_write()
+    swiss.migrate_participant_history()
+    db.session.commit()
+    db.session.expire_all()
+
+    for p in swiss.Participant.query.filter_by(tournament_id=tournament.id):
+        state = swiss.player_state_from_participant(p)
+        assert (state.last_colors, state.float_history) == legacy[p.id]
+    leftovers = db.session.execute(text(
+        "SELECT COUNT(*) FROM participant WHERE last_colors IS NOT NULL OR float_history IS NOT NULL")).scalar()
+    assert leftovers == 0
@@ -0,0 +1,43 @@
+import random
+
+from sqlalchemy import select
+
+
+def standings_rows(swiss, tournament_id):
+    Standing = swiss.Standing
+    columns = [Standing.participant_id, Standing.rank] + [getattr(Standing, c) for c in swiss.STANDING_COLUMNS]
+    return {row.participant_id: tuple(row) for row in swiss.db.session.execute(
+        select(*columns).where(Standing.tournament_id == tournament_id))}
+
+
+def play_round(swiss, tournament_id, round_number, rng):
+    ok, message = swiss.generate_next_round(tournament_id)
+    assert ok, message
+    games = swiss.Game.query.filter_by(tournament_id=tournament_id, round_number=round_number).all()
+    results = [{'board': g.board, 'result': rng.choice(['white', 'black', 'draw'])} for g in games]
+    report = swiss.apply_round_results(tournament_id, round_number, results)
+    assert not report['errors']
+
+
+def test_incremental_standings_match_a_full_rebuild_after_a_result_edit(swiss, make_tournament):
+    rng = random.Random(4)
+    tournament = make_tournament(11)
+    tournament_id = tournament.id
+    for round_number in (1, 2, 3):
+        play_round(swiss, tournament_id, round_number, rng)
+    before = standings_rows(swiss, tournament_id)
+
+    # Correct two round 1 results; only the players involved and their opponents are recomputed
+    edits = []
+    for game in swiss.Game.query.filter_by(tournament_id=tournament_id, round_number=1).limit(2):
+        new_result = {'white': 'black', 'black': 'draw', 'draw': 'white'}[game.result]
+        edits.append({'board': game.board, 'result': new_result})
+    report = swiss.apply_round_results(tournament_id, 1, edits)
+    assert report['updated'] == len(edits)
+    incremental = standings_rows(swiss, tournament_id)
+    assert incremental != before
+
+    swiss.Standing.query.filter_by(tournament_id=tournament_id).delete()
+    swiss.db.session.commit()
+    swiss.refresh_standings(tournament_id)
+    assert standings_rows(swiss, tournament_id) == incremental